@@ -6,8 +6,11 @@
 """
 
 from flask import Flask, request, jsonify, session
+from flask.json.provider import DefaultJSONProvider
+from flask.sessions import SessionInterface, SecureCookieSession
 from flask_cors import CORS
 import sqlite3
+import gzip
 import hashlib
 import secrets
 import smtplib
@@ -19,11 +22,48 @@ import threading
 import time
 import random
 from functools import wraps
+from collections import OrderedDict
 import re
 
+# 可选依赖：未安装时回退到标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# JSON编码器：优先使用orjson，未安装时使用Flask默认的标准库实现
+class FastJSONProvider(DefaultJSONProvider):
+    def _orjson_option(self, indent=False):
+        # 日期和dataclass交给Flask的default处理，保持与标准库一致的输出格式
+        option = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME |
+                  orjson.OPT_PASSTHROUGH_DATACLASS)
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_option()).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        data = orjson.dumps(obj, default=self.default, option=self._orjson_option(indent))
+        return self._app.response_class(data + b'\n', mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = 'mapleserver_secret_key_2025'
-app.config['SESSION_TYPE'] = 'filesystem'
 CORS(app, supports_credentials=True)
 
 # 数据库初始化
@@ -114,12 +154,198 @@ def init_db():
         )
     ''')
     
+    # 会话表（expires_at 为Unix时间戳）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            revoked BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)')
+    
     conn.commit()
     conn.close()
 
 # 初始化数据库
 init_db()
 
+# 会话配置
+SESSION_CONFIG = {
+    'cookie_name': 'maple_sid',
+    'lifetime': 7 * 24 * 3600,  # 滑动过期时间（秒），每次访问后重新计算
+    'cache_size': 1024,         # 进程内LRU缓存的最大会话数
+    'cache_ttl': 30,            # 缓存条目超过该秒数后回数据库校验（吊销、账号禁用）
+    'flush_interval': 60        # 批量写回过期时间并清理过期会话的间隔（秒）
+}
+
+# 服务端会话存储：SQLite持久化 + 进程内LRU读缓存
+class SessionStore:
+    def __init__(self, db_path='mapleserver.db'):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # sid -> {'data', 'user_id', 'expires_at', 'checked_at'}
+        self.touched = {}           # sid -> 待写回的 expires_at
+    
+    def _cache_put(self, sid, entry):
+        self.cache[sid] = entry
+        self.cache.move_to_end(sid)
+        while len(self.cache) > SESSION_CONFIG['cache_size']:
+            self.cache.popitem(last=False)
+    
+    def _load(self, sid):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.data, s.user_id, s.expires_at
+            FROM sessions s LEFT JOIN users u ON u.id = s.user_id
+            WHERE s.id = ? AND s.revoked = 0 AND s.expires_at > ?
+                  AND (s.user_id IS NULL OR u.is_active = 1)
+        ''', (sid, time.time()))
+        row = cursor.fetchone()
+        conn.close()
+        return row
+    
+    def get(self, sid):
+        """返回会话数据；会话不存在、已过期、已吊销或用户已禁用时返回None"""
+        now = time.time()
+        with self.lock:
+            entry = self.cache.get(sid)
+            if entry and entry['expires_at'] > now and now - entry['checked_at'] < SESSION_CONFIG['cache_ttl']:
+                self.cache.move_to_end(sid)
+                entry['expires_at'] = self.touched[sid] = now + SESSION_CONFIG['lifetime']
+                return entry['data']
+        
+        row = self._load(sid)
+        with self.lock:
+            if not row:
+                self.cache.pop(sid, None)
+                self.touched.pop(sid, None)
+                return None
+            expires_at = self.touched[sid] = now + SESSION_CONFIG['lifetime']
+            data = json.loads(row[0])
+            self._cache_put(sid, {'data': data, 'user_id': row[1],
+                                  'expires_at': expires_at, 'checked_at': now})
+            return data
+    
+    def save(self, sid, data):
+        """保存会话数据，sid为None时创建新会话并返回新sid"""
+        now = time.time()
+        expires_at = now + SESSION_CONFIG['lifetime']
+        user_id = data.get('user_id')
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        if sid is None:
+            sid = secrets.token_urlsafe(32)
+            cursor.execute('''
+                INSERT INTO sessions (id, user_id, data, expires_at) 
+                VALUES (?, ?, ?, ?)
+            ''', (sid, user_id, json.dumps(data), expires_at))
+        else:
+            cursor.execute('''
+                UPDATE sessions SET user_id = ?, data = ?, expires_at = ? 
+                WHERE id = ?
+            ''', (user_id, json.dumps(data), expires_at, sid))
+        conn.commit()
+        conn.close()
+        
+        with self.lock:
+            self.touched.pop(sid, None)
+            self._cache_put(sid, {'data': dict(data), 'user_id': user_id,
+                                  'expires_at': expires_at, 'checked_at': now})
+        return sid
+    
+    def revoke(self, sid):
+        with self.lock:
+            self.cache.pop(sid, None)
+            self.touched.pop(sid, None)
+        
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('UPDATE sessions SET revoked = 1 WHERE id = ?', (sid,))
+        conn.commit()
+        conn.close()
+    
+    def revoke_user(self, user_id):
+        """吊销用户的全部会话（如禁用账号、修改密码后调用）"""
+        with self.lock:
+            for sid in [sid for sid, entry in self.cache.items() if entry['user_id'] == user_id]:
+                del self.cache[sid]
+                self.touched.pop(sid, None)
+        
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('UPDATE sessions SET revoked = 1 WHERE user_id = ?', (user_id,))
+        conn.commit()
+        conn.close()
+    
+    def flush(self):
+        """批量写回滑动后的过期时间，并删除已过期或已吊销的会话"""
+        with self.lock:
+            touched, self.touched = self.touched, {}
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany('UPDATE sessions SET expires_at = ? WHERE id = ? AND revoked = 0',
+                           [(expires_at, sid) for sid, expires_at in touched.items()])
+        cursor.execute('DELETE FROM sessions WHERE expires_at <= ? OR revoked = 1', (time.time(),))
+        conn.commit()
+        conn.close()
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.loaded_user_id = dict.get(self, 'user_id')
+
+# Flask会话接口：Cookie中只保存会话ID，数据保存在服务端
+class SqliteSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+    
+    def open_session(self, app, request):
+        sid = request.cookies.get(SESSION_CONFIG['cookie_name'])
+        data = self.store.get(sid) if sid else None
+        if data is None:
+            return ServerSession()
+        return ServerSession(data, sid=sid)
+    
+    def save_session(self, app, session, response):
+        name = SESSION_CONFIG['cookie_name']
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.modified:
+            return
+        
+        # 会话被清空（退出登录）：服务端吊销
+        if not session:
+            if session.sid:
+                self.store.revoke(session.sid)
+            response.delete_cookie(name, domain=domain, path=path)
+            return
+        
+        # 登录用户发生变化时更换会话ID，防止会话固定攻击
+        sid = session.sid
+        if sid and session.get('user_id') != session.loaded_user_id:
+            self.store.revoke(sid)
+            sid = None
+        
+        new_sid = self.store.save(sid, dict(session))
+        if new_sid != session.sid:
+            response.set_cookie(name, new_sid, domain=domain, path=path,
+                                httponly=self.get_cookie_httponly(app),
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+session_store = SessionStore()
+app.session_interface = SqliteSessionInterface(session_store)
+
 # 邮件配置
 EMAIL_CONFIG = {
     'smtp_server': 'smtp.gmail.com',
@@ -136,10 +362,50 @@ SMS_CONFIG = {
     'sender': 'MapleServer'
 }
 
+# 响应压缩配置
+RESPONSE_CONFIG = {
+    'compress_min_size': 1024,  # 小于该字节数的响应不压缩
+    'gzip_level': 6,
+    'brotli_quality': 5
+}
+
+# 根据Accept-Encoding压缩JSON响应（优先brotli，其次gzip）
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough or not 200 <= response.status_code < 300
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < RESPONSE_CONFIG['compress_min_size']:
+        return response
+    
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding == 'br':
+        data = brotli.compress(data, quality=RESPONSE_CONFIG['brotli_quality'])
+    elif encoding == 'gzip':
+        data = gzip.compress(data, compresslevel=RESPONSE_CONFIG['gzip_level'])
+    else:
+        return response
+    
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# 列表数据：默认每行一个对象；请求带 ?format=columnar 时字段名只输出一次
+def list_payload(name, columns, rows):
+    if request.args.get('format') == 'columnar':
+        return {'success': True, 'format': 'columnar',
+                name: {'columns': list(columns), 'rows': rows}}
+    return {'success': True, name: [dict(zip(columns, row)) for row in rows]}
+
 # 装饰器：需要登录
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        # 会话在open_session中已由SessionStore校验（过期、吊销、账号禁用），失效时为空
         user_id = session.get('user_id')
         if not user_id:
             return jsonify({'success': False, 'message': '请先登录'}), 401
@@ -251,6 +517,18 @@ def email_worker():
 email_thread = threading.Thread(target=email_worker, daemon=True)
 email_thread.start()
 
+# 会话维护线程：批量写回过期时间、清理过期会话
+def session_worker():
+    while True:
+        time.sleep(SESSION_CONFIG['flush_interval'])
+        try:
+            session_store.flush()
+        except Exception as e:
+            print(f"会话清理错误: {e}")
+
+session_thread = threading.Thread(target=session_worker, daemon=True)
+session_thread.start()
+
 # 生成随机IP地址
 def generate_ip():
     return f"192.168.{random.randint(1, 255)}.{random.randint(1, 255)}"
@@ -630,17 +908,8 @@ def get_orders():
         orders = cursor.fetchall()
         conn.close()
         
-        orders_list = []
-        for order in orders:
-            orders_list.append({
-                'id': order[0],
-                'plan': order[1],
-                'amount': order[2],
-                'status': order[3],
-                'time': order[4]
-            })
-        
-        return jsonify({'success': True, 'orders': orders_list})
+        columns = ('id', 'plan', 'amount', 'status', 'time')
+        return jsonify(list_payload('orders', columns, orders))
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -664,19 +933,8 @@ def get_servers():
         servers = cursor.fetchall()
         conn.close()
         
-        servers_list = []
-        for server in servers:
-            servers_list.append({
-                'id': server[0],
-                'plan': server[1],
-                'ip': server[2],
-                'port': server[3],
-                'status': server[4],
-                'created': server[5],
-                'expires': server[6]
-            })
-        
-        return jsonify({'success': True, 'servers': servers_list})
+        columns = ('id', 'plan', 'ip', 'port', 'status', 'created', 'expires')
+        return jsonify(list_payload('servers', columns, servers))
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})